@@ -3,9 +3,15 @@ import pandas as pd
 import numpy as np
 import time
 import logging
-from threading import Thread
+import math
+import json
+import queue
+import multiprocessing
+from collections import deque
+from threading import Thread, Event, Lock
 from datetime import datetime, timezone
 from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # =========================================================
 # LOGGING
@@ -33,6 +39,7 @@ MT5_SERVER   = "XMGlobal-MT5 2"
 # =========================================================
 SYMBOL = "BTCUSD#"
 TIMEFRAME = mt5.TIMEFRAME_M1
+TIMEFRAME_SECONDS = 60
 MAGIC = 777
 
 # Risk Management
@@ -52,6 +59,7 @@ ATR_GRID_MULTIPLIER = 1.0  # Conservative for BTC volatility
 GLOBAL_COOLDOWN_SEC = 90  # 90 seconds between entries
 MAX_TRADES_PER_DAY = 30  # Conservative for BTC
 CANDLE_BLOCK = True  # Prevent multiple entries per candle
+STACK_CONFIRM_LEVEL = 3  # Levels from here need a bullish candle
 
 # Filters (STRICTER FOR BTC)
 ADX_THRESHOLD = 25  # Minimum ADX for trending market
@@ -60,6 +68,66 @@ RSI_MAX = 65
 AVOID_HIGH_VOLATILITY = True
 AVOID_SQUEEZE = True
 
+# Volatility Regime (ATR percentile over rolling M1 windows)
+VOL_REGIME_LOOKBACKS = [50, 1440, 10080]  # 50 bars, 1 day, 1 week
+VOL_REGIME_PRIMARY = 50  # Lookback that drives the high_vol filter
+VOL_REGIME_LOW_PCT = 30
+VOL_REGIME_HIGH_PCT = 70
+VOL_BUCKET_RESOLUTION = 0.002  # 0.2% relative ATR resolution per bucket
+
+# Connection Supervisor
+HEALTH_CHECK_INTERVAL_SEC = 2
+TICK_STALE_SEC = 30  # No new tick for this long = connection unhealthy
+RECONNECT_BACKOFF_MIN_SEC = 1
+RECONNECT_BACKOFF_MAX_SEC = 300
+RECONNECT_BACKOFF_RESET_SEC = 600  # Healthy this long = backoff starts over
+RECONNECT_POLL_SEC = 0.5  # Tick poll while waiting for the feed to resume
+BAR_CACHE_SIZE = 500  # M1 bars kept locally
+SNAPSHOT_MAX_AGE_SEC = 60  # Basket watcher trusts cached positions this long
+
+# Shadow Variants (paper-traded on the same data as the live strategy)
+# Each entry overrides strategy params, e.g.
+#   {"name": "adx20", "adx_threshold": 20}
+#   {"name": "wide_grid", "atr_grid_multiplier": 1.5}
+SHADOW_VARIANTS = []
+
+# Pending Grid (broker-side buy limits instead of polling for grid levels)
+PENDING_GRID_MODE = False
+PENDING_GRID_DEPTH = 2  # Ladder levels kept as pending orders
+PENDING_REPRICE_ATR_PCT = 20  # Re-price the ladder when ATR moves this much
+PENDING_GRID_RETRY_SEC = 5  # First retry after a rejected limit, doubles per failure
+PENDING_GRID_RETRY_MAX_SEC = 300
+# Blocks that pull the ladder; by default every block of the polled path.
+# Removing one is an explicit opt-in: limits then keep filling while that
+# filter would block a polled entry (e.g. dropping "momentum" lets levels
+# fill while -DI > +DI)
+PENDING_GRID_CANCEL_BLOCKS = [
+    "max_levels", "daily_limit", "cooldown", "session",
+    "htf_bearish", "momentum", "high_vol", "squeeze",
+]
+# Risk blocks pull the ladder at once. The other (short-lived) blocks must
+# hold for PENDING_GRID_BLOCK_HOLD_SEC before the ladder is pulled, and be
+# clear as long before it is re-placed. The hold is longer than
+# GLOBAL_COOLDOWN_SEC, so the post-entry cooldown alone never pulls it
+PENDING_GRID_RISK_BLOCKS = ["max_levels", "daily_limit", "htf_bearish", "high_vol"]
+PENDING_GRID_BLOCK_HOLD_SEC = 120
+
+# Status API (read-only JSON on localhost, served from in-process snapshots)
+STATUS_API_ENABLED = True
+STATUS_API_HOST = "127.0.0.1"
+STATUS_API_PORT = 8765
+STATUS_RECENT_TRADES = 20
+
+# Multi-Account Fan-out (one decision, executed on several accounts)
+# Each account gets its own worker process and terminal, e.g.
+#   {"name": "acc2", "path": r"C:\...\terminal64.exe", "login": 123,
+#    "password": "...", "server": "...", "max_levels": 4, "max_daily_loss_pct": 2.0}
+FANOUT_ACCOUNTS = []
+FANOUT_SIMULATE = False  # Execute on in-memory accounts instead of terminals
+FANOUT_SIM_EQUITY = 10000.0  # Starting equity of a simulated account
+FANOUT_SIGNAL_MAX_AGE_SEC = 5  # Workers drop entry signals older than this
+FANOUT_RISK_CHECK_SEC = 5  # Idle workers re-check their limits this often
+
 # State Variables
 lot_index = 0
 last_entry_time = 0
@@ -68,6 +136,43 @@ basket_active = False
 daily_trades = 0
 last_trade_date = None
 INITIAL_EQUITY = 0
+last_equity = 0
+CONTRACT_SIZE = 1.0
+PRICE_DIGITS = 2
+volume_specs = {}  # symbol -> (step, min, max), read once per process
+
+# Connection & Cache State
+mt5_connected = Event()
+cache_lock = Lock()
+bar_cache = None
+position_snapshot = []
+position_snapshot_time = 0
+last_tick_msc = 0
+last_tick_change = 0
+reconnect_delay = RECONNECT_BACKOFF_MIN_SEC
+last_reconnect_time = 0
+
+# Pending Grid State
+pending_grid_key = None
+pending_grid_atr = 0
+pending_grid_count = 0
+pending_grid_missing = 0
+pending_grid_failures = 0
+pending_grid_retry_at = 0
+pending_grid_pulled = False
+pending_block_since = 0
+pending_clear_since = 0
+known_tickets = set()  # Position tickets already accounted for (fill detection)
+
+# Status API State (pre-serialized JSON per path)
+status_sections = {}
+status_bodies = {}
+status_lock = Lock()
+
+# Fan-out State (main process side)
+fanout_queues = []
+fanout_results = None
+fanout_state = {}
 
 # Performance Tracking
 trade_log = {
@@ -79,13 +184,12 @@ trade_log = {
     'pnl': [],
     'equity': []
 }
+trade_log_lock = Lock()
 
 # =========================================================
 # INIT MT5
 # =========================================================
-def init_mt5():
-    global INITIAL_EQUITY
-    
+def connect_mt5():
     if not mt5.initialize(
         path=MT5_PATH,
         login=MT5_LOGIN,
@@ -97,19 +201,194 @@ def init_mt5():
     if not mt5.symbol_select(SYMBOL, True):
         raise RuntimeError("Symbol select failed")
 
-    info = mt5.symbol_info(SYMBOL)
+    return mt5.symbol_info(SYMBOL)
+
+def init_mt5():
+    global INITIAL_EQUITY, CONTRACT_SIZE, PRICE_DIGITS
+    
+    info = connect_mt5()
     if info.trade_mode != mt5.SYMBOL_TRADE_MODE_FULL:
         raise RuntimeError("Trading disabled for symbol")
+    CONTRACT_SIZE = info.trade_contract_size
+    PRICE_DIGITS = info.digits
+    volume_specs[SYMBOL] = (info.volume_step, info.volume_min, info.volume_max)
 
     account = mt5.account_info()
     INITIAL_EQUITY = account.equity
 
+    resync_caches()
+    mt5_connected.set()
+
     log.info(
         f"CONNECTED | {SYMBOL} | "
         f"min_lot={info.volume_min} step={info.volume_step} | "
         f"Initial Equity=${INITIAL_EQUITY:.2f}"
     )
 
+# =========================================================
+# CONNECTION SUPERVISOR
+# =========================================================
+def check_connection_health():
+    """
+    Returns None if the terminal looks healthy, otherwise the reason
+    - terminal connected to the trade server
+    - ticks are still arriving
+    """
+    global last_tick_msc, last_tick_change
+    
+    terminal = mt5.terminal_info()
+    if terminal is None or not terminal.connected:
+        return f"terminal disconnected {mt5.last_error()}"
+    
+    tick = mt5.symbol_info_tick(SYMBOL)
+    if tick is None:
+        return f"no tick {mt5.last_error()}"
+    
+    now = time.time()
+    if tick.time_msc != last_tick_msc:
+        last_tick_msc = tick.time_msc
+        last_tick_change = now
+    elif now - last_tick_change > TICK_STALE_SEC:
+        return f"tick stale for {now - last_tick_change:.0f}s"
+    return None
+
+def wait_for_new_tick(after_msc):
+    """Reason if no tick newer than `after_msc` has arrived, else None"""
+    global last_tick_msc, last_tick_change
+    
+    tick = mt5.symbol_info_tick(SYMBOL)
+    if tick is None:
+        return f"no tick {mt5.last_error()}"
+    if tick.time_msc <= after_msc:
+        return "no new tick since disconnect"
+    
+    last_tick_msc = tick.time_msc
+    last_tick_change = time.time()
+    return None
+
+def reconnect_mt5():
+    """
+    Wait until healthy again: connected and a tick newer than the last one
+    seen before the failure
+    - the tick is polled every RECONNECT_POLL_SEC (a cheap local call), so
+      recovery is noticed within a second however long the outage was
+    - only shutdown/initialize is rate-limited by the exponential backoff,
+      and only while the terminal is not connected (or right after failure)
+    - backoff carries over if the previous reconnect did not stay healthy
+    """
+    global reconnect_delay, last_reconnect_time
+    
+    now = time.time()
+    if now - last_reconnect_time > RECONNECT_BACKOFF_RESET_SEC:
+        reconnect_delay = RECONNECT_BACKOFF_MIN_SEC
+        reinit_at = now
+    else:
+        log.info(f"RECONNECT BACKOFF | flapping, re-init not before {reconnect_delay}s")
+        reinit_at = now + reconnect_delay
+    
+    stale_msc = last_tick_msc
+    reinit = True
+    
+    while True:
+        try:
+            if reinit and time.time() >= reinit_at:
+                log.warning(f"RECONNECT | re-initializing terminal (next backoff {reconnect_delay}s)")
+                reinit_at = time.time() + reconnect_delay
+                reconnect_delay = min(reconnect_delay * 2, RECONNECT_BACKOFF_MAX_SEC)
+                mt5.shutdown()
+                connect_mt5()
+                reinit = False
+            
+            terminal = mt5.terminal_info()
+            if terminal is None or not terminal.connected:
+                reinit = True
+            elif wait_for_new_tick(stale_msc) is None:
+                last_reconnect_time = time.time()
+                return
+        except Exception as e:
+            log.error(f"RECONNECT FAILED: {e}")
+            reinit = True
+        
+        time.sleep(RECONNECT_POLL_SEC)
+
+def connection_supervisor():
+    log.info("CONNECTION SUPERVISOR STARTED")
+    
+    while True:
+        try:
+            reason = check_connection_health()
+            if reason:
+                mt5_connected.clear()
+                down_since = time.time()
+                log.error(f"CONNECTION LOST | {reason}")
+                
+                reconnect_mt5()
+                resync_caches()
+                mt5_connected.set()
+                
+                log.info(
+                    f"RECONNECTED | blind={time.time() - down_since:.1f}s | "
+                    f"bars={len(bar_cache)} | positions={len(position_snapshot)}"
+                )
+        except Exception as e:
+            log.error(f"CONNECTION SUPERVISOR ERROR: {e}")
+        
+        time.sleep(HEALTH_CHECK_INTERVAL_SEC)
+
+# =========================================================
+# LOCAL CACHES (BARS & POSITIONS)
+# =========================================================
+def sync_bars():
+    """
+    Fetch only bars newer than the cache (the forming candle is re-read)
+    Fetch size grows until it overlaps the cache, so a reconnect after
+    N minutes costs ~N bars instead of a full refetch
+    """
+    global bar_cache
+    
+    with cache_lock:
+        last_time = int(bar_cache['time'].iloc[-1]) if bar_cache is not None else None
+        count = 2 if last_time is not None else BAR_CACHE_SIZE
+        
+        while True:
+            rates = mt5.copy_rates_from_pos(SYMBOL, TIMEFRAME, 0, count)
+            if rates is None or len(rates) == 0:
+                return False
+            if last_time is None or int(rates[0]['time']) <= last_time or count >= BAR_CACHE_SIZE:
+                break
+            count = min(count * 4, BAR_CACHE_SIZE)
+        
+        fresh = pd.DataFrame(rates)
+        if last_time is not None and int(rates[0]['time']) <= last_time:
+            fresh = pd.concat([bar_cache[bar_cache['time'] < fresh['time'].iloc[0]], fresh])
+        bar_cache = fresh.iloc[-BAR_CACHE_SIZE:].reset_index(drop=True)
+        return True
+
+def get_bars(count):
+    with cache_lock:
+        if bar_cache is None:
+            return None
+        return bar_cache.iloc[-count:].reset_index(drop=True)
+
+def refresh_positions():
+    """Update the position snapshot; keeps the last one on failure"""
+    global position_snapshot, position_snapshot_time
+    
+    positions = mt5.positions_get(symbol=SYMBOL)
+    if positions is None:
+        return False
+    
+    position_snapshot = [p for p in positions if p.type == mt5.ORDER_TYPE_BUY]
+    position_snapshot_time = time.time()
+    return True
+
+def snapshot_age():
+    return time.time() - position_snapshot_time
+
+def resync_caches():
+    sync_bars()
+    refresh_positions()
+
 # =========================================================
 # INDICATORS
 # =========================================================
@@ -166,7 +445,10 @@ def calculate_adx(df, period=14):
 # POSITIONS
 # =========================================================
 def get_buy_positions():
-    return [p for p in mt5.positions_get(symbol=SYMBOL) or [] if p.type == mt5.ORDER_TYPE_BUY]
+    """Live positions when connected, otherwise the last snapshot"""
+    if mt5_connected.is_set():
+        refresh_positions()
+    return position_snapshot
 
 def total_buy_volume():
     return sum(p.volume for p in get_buy_positions())
@@ -186,10 +468,10 @@ def floating_buy_pnl():
 # LOT NORMALIZATION
 # =========================================================
 def normalize_lot(symbol, lot):
-    info = mt5.symbol_info(symbol)
-    step = info.volume_step
-    min_lot = info.volume_min
-    max_lot = info.volume_max
+    if symbol not in volume_specs:
+        info = mt5.symbol_info(symbol)
+        volume_specs[symbol] = (info.volume_step, info.volume_min, info.volume_max)
+    step, min_lot, max_lot = volume_specs[symbol]
     normalized = max(min_lot, round(lot / step) * step)
     return min(normalized, max_lot)
 
@@ -203,48 +485,56 @@ def reset_after_tp():
 # =========================================================
 # DYNAMIC LOT CALCULATION
 # =========================================================
-def calculate_dynamic_lot(level, atr_current, atr_avg):
+def calculate_dynamic_lot(level, atr_current, atr_avg, equity=None, martingale=MARTINGALE_MULTIPLIER):
     """
     Calculate lot size based on:
     - Level (Martingale progression)
     - ATR (volatility adjustment)
-    - Account equity (risk management)
+    - Account equity (risk management, live account if not given)
     """
-    account = mt5.account_info()
-    equity = account.equity
+    if equity is None:
+        equity = mt5.account_info().equity
     
+    return normalize_lot(SYMBOL, dynamic_lot_size(level, atr_current, atr_avg, equity, martingale))
+
+def dynamic_lot_size(level, atr_current, atr_avg, equity, martingale=MARTINGALE_MULTIPLIER):
+    """Un-normalized lot, so other accounts can scale it before rounding"""
+    lot = base_lot_size(level, atr_current, atr_avg, martingale)
+    return min(lot, max_risk_lot(equity, atr_current))
+
+def base_lot_size(level, atr_current, atr_avg, martingale=MARTINGALE_MULTIPLIER):
+    """Martingale and volatility sized lot, before the equity risk cap"""
     # Martingale multiplier with diminishing returns
     if level == 0:
         multiplier = 1.0
     elif level <= 2:
-        multiplier = MARTINGALE_MULTIPLIER ** level
+        multiplier = martingale ** level
     else:
         # Slower growth after level 2
-        multiplier = (MARTINGALE_MULTIPLIER ** 2) * (1.2 ** (level - 2))
+        multiplier = (martingale ** 2) * (1.2 ** (level - 2))
     
     # ATR-based adjustment (reduce size in high volatility)
     vol_factor = min(1.0, atr_avg / atr_current) if atr_current > 0 else 1.0
     
-    # Calculate lot
-    lot = BASE_LOT * multiplier * vol_factor
-    
-    # Cap based on max risk
+    return BASE_LOT * multiplier * vol_factor
+
+def max_risk_lot(equity, atr_current):
+    """Cap based on max risk (no cap without ATR)"""
+    if atr_current <= 0:
+        return float('inf')
     max_risk_dollars = equity * (MAX_RISK_PCT / 100)
-    max_lot = max_risk_dollars / (atr_current * 10) if atr_current > 0 else lot
-    lot = min(lot, max_lot)
-    
-    return normalize_lot(SYMBOL, lot)
+    return max_risk_dollars / (atr_current * 10)
 
 # =========================================================
 # GRID SPACING
 # =========================================================
-def calculate_grid_spacing(atr_current, level):
+def calculate_grid_spacing(atr_current, level, atr_multiplier=ATR_GRID_MULTIPLIER):
     """
     Dynamic grid spacing based on:
     - ATR (volatility)
     - Level (wider spacing for deeper levels)
     """
-    base_spacing = atr_current * ATR_GRID_MULTIPLIER
+    base_spacing = atr_current * atr_multiplier
     
     # Increase spacing for deeper levels
     level_multiplier = 1.0 + (level * 0.15)  # +15% per level
@@ -286,48 +576,173 @@ def get_htf_bias(symbol, timeframe_higher):
 # =========================================================
 # MOMENTUM FILTER
 # =========================================================
-def momentum_filter(df):
+def momentum_indicators(df):
     """
-    Returns True if momentum supports entry
-    - ADX > 20 (trending, not ranging)
-    - RSI between 30-70 (not overbought/oversold)
-    - +DI > -DI (bullish momentum)
+    Last RSI / ADX / DI values, computed once per bar snapshot
+    Returns None if there is not enough data
     """
     if len(df) < 50:
-        return False
+        return None
     
     rsi = calculate_rsi(df['close'], 14)
     adx, plus_di, minus_di = calculate_adx(df, 14)
     
-    trending = adx.iloc[-1] > ADX_THRESHOLD
-    not_extreme = RSI_MIN < rsi.iloc[-1] < RSI_MAX
-    bullish_momentum = plus_di.iloc[-1] > minus_di.iloc[-1]
+    return {
+        'rsi': rsi.iloc[-1],
+        'adx': adx.iloc[-1],
+        'plus_di': plus_di.iloc[-1],
+        'minus_di': minus_di.iloc[-1],
+    }
+
+def momentum_filter(indicators, adx_threshold=ADX_THRESHOLD, rsi_min=RSI_MIN, rsi_max=RSI_MAX):
+    """
+    Returns True if momentum supports entry
+    - ADX > threshold (trending, not ranging)
+    - RSI inside band (not overbought/oversold)
+    - +DI > -DI (bullish momentum)
+    """
+    if indicators is None:
+        return False
+    
+    trending = indicators['adx'] > adx_threshold
+    not_extreme = rsi_min < indicators['rsi'] < rsi_max
+    bullish_momentum = indicators['plus_di'] > indicators['minus_di']
     
     return trending and not_extreme and bullish_momentum
 
 # =========================================================
 # VOLATILITY REGIME
 # =========================================================
-def get_volatility_regime(df, atr_period=14, lookback=50):
+class RollingPercentile:
     """
-    Classify current volatility as 'low', 'normal', 'high'
-    Based on ATR percentile over lookback period
+    ATR percentile over the last `window` bars
+    Values are bucketed on a log scale and counted in a Fenwick tree,
+    so push/evict/rank are O(log buckets) per bar
     """
-    atr = ATR(df, atr_period)
-    if len(atr) < lookback:
-        return 'normal'
-    
-    current_atr = atr.iloc[-1]
-    atr_history = atr.iloc[-lookback:]
-    percentile = (atr_history < current_atr).sum() / len(atr_history) * 100
-    
-    if percentile < 30:
+    def __init__(self, window, resolution=VOL_BUCKET_RESOLUTION, min_value=1e-3, max_value=1e6):
+        self.window = window
+        self._log_min = math.log(min_value)
+        self._log_step = math.log1p(resolution)
+        self.size = int((math.log(max_value) - self._log_min) / self._log_step) + 1
+        self.tree = [0] * (self.size + 1)
+        self.buckets = deque()
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def _bucket(self, value):
+        if not value > 0:
+            return 1
+        idx = int((math.log(value) - self._log_min) / self._log_step) + 1
+        return max(1, min(idx, self.size))
+
+    def _add(self, i, delta):
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def _count_upto(self, i):
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def push(self, value):
+        b = self._bucket(value)
+        self.buckets.append(b)
+        self._add(b, 1)
+        if len(self.buckets) > self.window:
+            self._add(self.buckets.popleft(), -1)
+
+    def percentile(self, value):
+        """% of values in the window below `value` (bucket resolution)"""
+        if not self.buckets:
+            return 50.0
+        below = self._count_upto(self._bucket(value) - 1)
+        return below / len(self.buckets) * 100
+
+
+class VolatilityRegimeTracker:
+    """
+    Feeds closed-bar ATR values into one RollingPercentile per lookback
+    Bars are consumed once (by time), so each call only pays for new bars
+    """
+    def __init__(self, lookbacks, atr_period=14):
+        self.atr_period = atr_period
+        self.windows = {lb: RollingPercentile(lb) for lb in sorted(set(lookbacks))}
+        self.last_bar_time = 0
+        self.last_percentiles = {}
+
+    def needed_history(self, df):
+        """Number of bars to fetch so no closed bar is missed"""
+        max_lookback = max(self.windows)
+        if self.last_bar_time == 0:
+            return max_lookback + self.atr_period + 1
+        # The first atr_period rows of df have no ATR yet, so the next unseen
+        # bar must come after them or it would be skipped for good
+        first_time = int(df['time'].iloc[0])
+        if first_time + self.atr_period * TIMEFRAME_SECONDS <= self.last_bar_time + TIMEFRAME_SECONDS:
+            return 0
+        missing = (first_time - self.last_bar_time) // TIMEFRAME_SECONDS
+        return min(max(missing, 0), max_lookback) + len(df) + self.atr_period
+
+    def update(self, df):
+        """
+        Push ATR of closed bars newer than the last seen bar
+        The last row is the forming candle; its ATR is returned, not stored
+        """
+        atr = ATR(df, self.atr_period)
+        times = df['time'].values[:-1]
+        values = atr.values[:-1]
+        for t, value in zip(times, values):
+            if t <= self.last_bar_time:
+                continue
+            self.last_bar_time = int(t)
+            if np.isnan(value):
+                continue
+            for window in self.windows.values():
+                window.push(value)
+        return atr.iloc[-1]
+
+    def percentiles(self, value):
+        self.last_percentiles = {lb: w.percentile(value) for lb, w in self.windows.items()}
+        return self.last_percentiles
+
+
+# The primary lookback is always tracked, even if missing from the list
+vol_tracker = VolatilityRegimeTracker(VOL_REGIME_LOOKBACKS + [VOL_REGIME_PRIMARY])
+
+def classify_volatility(percentile):
+    if percentile < VOL_REGIME_LOW_PCT:
         return 'low'
-    elif percentile > 70:
+    elif percentile > VOL_REGIME_HIGH_PCT:
         return 'high'
     else:
         return 'normal'
 
+def get_volatility_regime(df, lookback=VOL_REGIME_PRIMARY):
+    """
+    Classify current volatility as 'low', 'normal', 'high'
+    Based on ATR percentile over the tracked lookback (in bars)
+    """
+    count = vol_tracker.needed_history(df)
+    if count > 0:
+        history = mt5.copy_rates_from_pos(SYMBOL, TIMEFRAME, 0, count)
+        if history is not None and len(history) > vol_tracker.atr_period:
+            vol_tracker.update(pd.DataFrame(history))
+    
+    current_atr = vol_tracker.update(df)
+    if np.isnan(current_atr):
+        return 'normal'
+    
+    percentiles = vol_tracker.percentiles(current_atr)
+    window = vol_tracker.windows[lookback]
+    if len(window) < window.window:
+        return 'normal'
+    
+    return classify_volatility(percentiles[lookback])
+
 def bollinger_squeeze(df, period=20, std_dev=2):
     """
     Detect Bollinger Band squeeze (low volatility)
@@ -411,8 +826,10 @@ def check_equity_stop():
     """
     Close all positions if equity drops below threshold
     """
+    global last_equity
     account = mt5.account_info()
     current_equity = account.equity
+    last_equity = current_equity
     
     dd_pct = ((INITIAL_EQUITY - current_equity) / INITIAL_EQUITY) * 100
     
@@ -441,6 +858,17 @@ def check_daily_loss():
 # =========================================================
 # ORDERS (EXECUTION SAFE)
 # =========================================================
+def log_trade(kind, level, lot, price, pnl, equity, journal=trade_log, lock=trade_log_lock):
+    """Append one row to a trade journal; rows are written whole under its lock"""
+    with lock:
+        journal['timestamp'].append(datetime.now())
+        journal['type'].append(kind)
+        journal['level'].append(level)
+        journal['lot'].append(lot)
+        journal['price'].append(price)
+        journal['pnl'].append(pnl)
+        journal['equity'].append(equity)
+
 def buy(lot):
     global last_entry_time, last_buy_candle_time, lot_index, daily_trades
     
@@ -451,46 +879,46 @@ def buy(lot):
     rates = mt5.copy_rates_from_pos(SYMBOL, TIMEFRAME, 0, 1)
     if rates is None or len(rates) == 0:
         log.warning("No candle data, skipping buy")
-        return
+        return False
     current_candle_time = int(rates[-1]['time'])
 
     # Prevent multiple buys in the same candle
     if CANDLE_BLOCK and current_candle_time == last_buy_candle_time:
         log.info("BUY BLOCKED | already bought in this candle")
-        return
+        return False
 
     # Send Buy order
-    result = mt5.order_send({
-        "action": mt5.TRADE_ACTION_DEAL,
-        "symbol": SYMBOL,
-        "volume": lot,
-        "type": mt5.ORDER_TYPE_BUY,
-        "price": tick.ask,
-        "magic": MAGIC,
-        "deviation": 50,
-        "comment": f"Grid L{lot_index}",
-        "type_filling": mt5.ORDER_FILLING_IOC,
-        "type_time": mt5.ORDER_TIME_GTC
-    })
+    result = send_market_buy(lot, tick.ask, f"Grid L{lot_index}")
 
     if result.retcode == mt5.TRADE_RETCODE_DONE:
+        known_tickets.add(result.order)  # Hedging: position ticket = order ticket
         last_entry_time = time.time()
         last_buy_candle_time = current_candle_time
         daily_trades += 1
         
         # Log trade
         account = mt5.account_info()
-        trade_log['timestamp'].append(datetime.now())
-        trade_log['type'].append('entry')
-        trade_log['level'].append(lot_index)
-        trade_log['lot'].append(lot)
-        trade_log['price'].append(tick.ask)
-        trade_log['pnl'].append(0)
-        trade_log['equity'].append(account.equity)
+        log_trade('entry', lot_index, lot, tick.ask, 0, account.equity)
         
         log.info(f"BUY EXECUTED | lot={lot} level={lot_index} price={tick.ask:.2f}")
+        return True
     else:
         log.error(f"BUY FAILED | retcode={result.retcode} lot={lot}")
+        return False
+
+def send_market_buy(lot, price, comment):
+    return mt5.order_send({
+        "action": mt5.TRADE_ACTION_DEAL,
+        "symbol": SYMBOL,
+        "volume": lot,
+        "type": mt5.ORDER_TYPE_BUY,
+        "price": price,
+        "magic": MAGIC,
+        "deviation": 50,
+        "comment": comment,
+        "type_filling": mt5.ORDER_FILLING_IOC,
+        "type_time": mt5.ORDER_TIME_GTC
+    })
 
 def close_position(p):
     tick = mt5.symbol_info_tick(SYMBOL)
@@ -510,6 +938,9 @@ def close_position(p):
     return result
 
 def close_all_buys():
+    if PENDING_GRID_MODE:
+        cancel_pending_grid()
+    
     pos = get_buy_positions()
     if not pos:
         return
@@ -517,19 +948,178 @@ def close_all_buys():
     total_pnl = sum(p.profit for p in pos)
     log.warning(f"CLOSING ALL BUYS | count={len(pos)} | PnL=${total_pnl:.2f}")
     
+    if fanout_queues:
+        tick = mt5.symbol_info_tick(SYMBOL)
+        fanout_signal('close_all', bid=tick.bid)
+    
     # Log exit
     account = mt5.account_info()
-    trade_log['timestamp'].append(datetime.now())
-    trade_log['type'].append('exit')
-    trade_log['level'].append(len(pos))
-    trade_log['lot'].append(sum(p.volume for p in pos))
-    trade_log['price'].append(avg_buy_price())
-    trade_log['pnl'].append(total_pnl)
-    trade_log['equity'].append(account.equity)
+    log_trade('exit', len(pos), sum(p.volume for p in pos), avg_buy_price(), total_pnl, account.equity)
     
     with ThreadPoolExecutor(max_workers=min(5, len(pos))) as exe:
         exe.map(close_position, pos)
 
+# =========================================================
+# PENDING GRID
+# =========================================================
+def get_pending_buy_limits():
+    orders = mt5.orders_get(symbol=SYMBOL)
+    if orders is None:
+        return None
+    return [o for o in orders if o.magic == MAGIC and o.type == mt5.ORDER_TYPE_BUY_LIMIT]
+
+def place_buy_limit(price, lot, level):
+    result = mt5.order_send({
+        "action": mt5.TRADE_ACTION_PENDING,
+        "symbol": SYMBOL,
+        "volume": lot,
+        "type": mt5.ORDER_TYPE_BUY_LIMIT,
+        "price": round(price, PRICE_DIGITS),
+        "magic": MAGIC,
+        "comment": f"Grid L{level}",
+        "type_filling": mt5.ORDER_FILLING_RETURN,
+        "type_time": mt5.ORDER_TIME_GTC
+    })
+    if result.retcode != mt5.TRADE_RETCODE_DONE:
+        log.error(f"BUY LIMIT FAILED | retcode={result.retcode} level={level} price={price:.2f}")
+    return result
+
+def cancel_pending_grid(orders=None):
+    """Remove the ladder; False if any remove was not confirmed"""
+    global pending_grid_key
+    
+    if orders is None:
+        orders = get_pending_buy_limits() or []
+    ok = True
+    for o in orders:
+        result = mt5.order_send({"action": mt5.TRADE_ACTION_REMOVE, "order": o.ticket})
+        if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
+            ok = False
+            log.error(f"PENDING CANCEL FAILED | order={o.ticket} retcode={getattr(result, 'retcode', None)}")
+    if orders:
+        log.info(f"PENDING GRID CANCELLED | orders={len(orders)} | confirmed={ok}")
+    pending_grid_key = None
+    return ok
+
+def clear_ladder_for_market_stack():
+    """
+    Pull the ladder before a polled market stack. False means skip the
+    market buy: a limit could not be removed, or one filled meanwhile
+    (the fill is picked up on the next loop)
+    """
+    if not cancel_pending_grid():
+        return False
+    remaining = get_pending_buy_limits()
+    if remaining is None or remaining:
+        return False
+    return all(p.ticket in known_tickets for p in get_buy_positions())
+
+def pending_grid_blocked(blocks):
+    """
+    Whether the ladder should be off the book, with hysteresis
+    - risk blocks pull it at once
+    - other cancel blocks must hold PENDING_GRID_BLOCK_HOLD_SEC to pull it,
+      and be clear as long before it is re-placed
+    """
+    global pending_grid_pulled, pending_block_since, pending_clear_since
+    
+    now = time.time()
+    if any(b in PENDING_GRID_CANCEL_BLOCKS for b in blocks):
+        pending_block_since = pending_block_since or now
+        pending_clear_since = 0
+    else:
+        pending_clear_since = pending_clear_since or now
+        pending_block_since = 0
+    
+    if any(b in PENDING_GRID_RISK_BLOCKS for b in blocks):
+        pending_grid_pulled = True
+    elif pending_block_since and now - pending_block_since >= PENDING_GRID_BLOCK_HOLD_SEC:
+        pending_grid_pulled = True
+    elif pending_clear_since and now - pending_clear_since >= PENDING_GRID_BLOCK_HOLD_SEC:
+        pending_grid_pulled = False
+    return pending_grid_pulled
+
+def desired_pending_grid(anchor_price, level, ask, atr_current, atr_avg):
+    """
+    Next ladder levels as (level, price, lot), same spacing and sizing
+    as the polled grid. Confirmation levels stay on the polling path
+    """
+    equity = mt5.account_info().equity
+    ladder = []
+    price = anchor_price
+    
+    for lvl in range(level, min(level + PENDING_GRID_DEPTH, MAX_LEVELS, STACK_CONFIRM_LEVEL)):
+        price -= calculate_grid_spacing(atr_current, lvl)
+        if price >= ask:
+            continue  # Already through this level, market path handles it
+        lot = calculate_dynamic_lot(lvl, atr_current, atr_avg, equity=equity)
+        ladder.append((lvl, price, lot))
+    return ladder
+
+def sync_pending_grid(snap, pos, level, blocks):
+    """
+    Keep the next ladder levels as broker-side buy limits
+    - anchored on the newest position of the basket
+    - re-priced only when a level fills or ATR moves PENDING_REPRICE_ATR_PCT
+    - removed when the basket closes or pending_grid_blocked says so
+    - rejected levels are retried with backoff, not every loop
+    """
+    global pending_grid_key, pending_grid_atr, pending_grid_count
+    global pending_grid_missing, pending_grid_failures, pending_grid_retry_at
+    
+    orders = get_pending_buy_limits()
+    if orders is None:
+        return
+    
+    blocked = pending_grid_blocked(blocks)
+    if not pos or blocked:
+        if orders:
+            cancel_pending_grid(orders)
+        return
+    
+    atr_current = snap['atr_current']
+    if np.isnan(atr_current) or snap['tick'] is None:
+        return
+    
+    anchor = max(pos, key=lambda p: p.time)
+    key = (anchor.ticket, level)
+    atr_moved = (
+        pending_grid_atr <= 0 or
+        abs(atr_current - pending_grid_atr) / pending_grid_atr * 100 >= PENDING_REPRICE_ATR_PCT
+    )
+    unchanged = key == pending_grid_key and not atr_moved
+    if unchanged and len(orders) == pending_grid_count and not pending_grid_missing:
+        return
+    if unchanged and time.time() < pending_grid_retry_at:
+        return
+    
+    ladder = desired_pending_grid(
+        anchor.price_open, level, snap['tick'].ask, atr_current, snap['atr_avg']
+    )
+    cancel_pending_grid(orders)
+    placed = sum(
+        place_buy_limit(price, lot, lvl).retcode == mt5.TRADE_RETCODE_DONE
+        for lvl, price, lot in ladder
+    )
+    
+    pending_grid_key = key
+    pending_grid_atr = atr_current
+    pending_grid_count = placed
+    pending_grid_missing = len(ladder) - placed
+    if pending_grid_missing:
+        pending_grid_failures += 1
+        delay = min(PENDING_GRID_RETRY_SEC * 2 ** (pending_grid_failures - 1), PENDING_GRID_RETRY_MAX_SEC)
+        pending_grid_retry_at = time.time() + delay
+        log.warning(f"PENDING GRID INCOMPLETE | placed={placed}/{len(ladder)} | retry in {delay}s")
+    else:
+        pending_grid_failures = 0
+        pending_grid_retry_at = 0
+    if ladder:
+        log.info(
+            f"PENDING GRID SET | ATR={atr_current:.2f} | "
+            + " ".join(f"L{lvl}@{price:.2f}x{lot}" for lvl, price, lot in ladder)
+        )
+
 # =========================================================
 # DYNAMIC TAKE PROFIT
 # =========================================================
@@ -586,16 +1176,25 @@ def basket_watcher():
                 if basket_active:
                     log.info("No positions - Resetting basket state")
                 basket_active = False
+                publish_status(basket={"positions": [], "connected": mt5_connected.is_set()})
                 time.sleep(0.5)
                 continue
             
+            # Don't manage the basket from a snapshot older than the bound
+            age = snapshot_age()
+            if age > SNAPSHOT_MAX_AGE_SEC:
+                log.warning(f"[BASKET] snapshot stale ({age:.0f}s) - holding")
+                time.sleep(1)
+                continue
+            
             # Get current data
-            rates = mt5.copy_rates_from_pos(SYMBOL, TIMEFRAME, 0, 50)
-            if rates is None or len(rates) < 50:
+            if mt5_connected.is_set():
+                sync_bars()
+            df = get_bars(50)
+            if df is None or len(df) < 50:
                 time.sleep(0.5)
                 continue
             
-            df = pd.DataFrame(rates)
             atr = ATR(df, 14)
             atr_current = atr.iloc[-1]
             atr_avg = atr.rolling(50).mean().iloc[-1]
@@ -607,6 +1206,19 @@ def basket_watcher():
             # Calculate dynamic TP
             tp_target = calculate_dynamic_tp(pos_count, avg_price, current_price, atr_current, atr_avg)
             
+            publish_status(basket={
+                "positions": [
+                    {k: getattr(p, k) for k in ("ticket", "time", "volume", "price_open", "profit", "comment")}
+                    for p in pos
+                ],
+                "vwap": avg_price,
+                "floating_pnl": floating_pnl,
+                "tp_target": tp_target,
+                "price": current_price,
+                "snapshot_age": age,
+                "connected": mt5_connected.is_set(),
+            })
+            
             log.info(
                 f"[BASKET] PnL=${floating_pnl:.2f} | "
                 f"Avg={avg_price:.2f} | TP={tp_target:.2f if tp_target else 'N/A'} | "
@@ -615,6 +1227,14 @@ def basket_watcher():
             
             # Close if TP hit
             if tp_target and floating_pnl >= tp_target:
+                if not mt5_connected.is_set():
+                    log.warning(
+                        f"BASKET TP HIT ON SNAPSHOT ({age:.0f}s old) | "
+                        f"waiting for reconnect to close"
+                    )
+                    time.sleep(0.2)
+                    continue
+                
                 log.info(
                     f"BASKET TP HIT | "
                     f"PnL=${floating_pnl:.2f} | TP=${tp_target:.2f}"
@@ -631,127 +1251,649 @@ def basket_watcher():
             log.error(f"BASKET WATCHER ERROR: {e}")
             time.sleep(1)
 
+# =========================================================
+# ENTRY DECISION
+# =========================================================
+def strategy_params(overrides=None):
+    """Strategy parameters, optionally overridden (shadow variants)"""
+    params = {
+        'adx_threshold': ADX_THRESHOLD,
+        'rsi_min': RSI_MIN,
+        'rsi_max': RSI_MAX,
+        'atr_grid_multiplier': ATR_GRID_MULTIPLIER,
+        'martingale_multiplier': MARTINGALE_MULTIPLIER,
+    }
+    unknown = set(overrides or {}) - set(params)
+    if unknown:
+        raise ValueError(f"Unknown strategy params {sorted(unknown)}, expected {sorted(params)}")
+    params.update(overrides or {})
+    return params
+
+def build_market_snapshot(df):
+    """
+    Everything the entry decision needs that does not depend on params
+    Computed once per loop and shared by every variant
+    """
+    atr = ATR(df, 14)
+    tick = mt5.symbol_info_tick(SYMBOL)
+    
+    return {
+        'time': time.time(),
+        'tick': tick,
+        'price': df['close'].iloc[-1],
+        'candle_time': int(df['time'].iloc[-1]),
+        'bullish_candle': df['close'].iloc[-1] > df['open'].iloc[-1],
+        'atr_current': atr.iloc[-1],
+        'atr_avg': atr.rolling(50).mean().iloc[-1],
+        'momentum': momentum_indicators(df),
+        'session_ok': session_filter(),
+        'htf_5m': get_htf_bias(SYMBOL, mt5.TIMEFRAME_M5),
+        'htf_15m': get_htf_bias(SYMBOL, mt5.TIMEFRAME_M15),
+        'vol_regime': get_volatility_regime(df),
+        'squeeze': bollinger_squeeze(df),
+    }
+
+def entry_decision(snap, params, pos_count, level, last_entry, trades_today, last_price):
+    """
+    Entry logic shared by the live strategy and shadow variants
+    Returns (action, blocks) where action is:
+    - 'open'    first entry of a basket
+    - 'stack'   next grid level
+    - 'confirm' grid level reached, waiting for a bullish candle
+    - None      nothing to do
+    """
+    checks = [
+        ("max_levels", level >= MAX_LEVELS),
+        ("daily_limit", trades_today >= MAX_TRADES_PER_DAY),
+        ("cooldown", time.time() - last_entry < GLOBAL_COOLDOWN_SEC),
+        ("session", not snap['session_ok']),
+        ("htf_bearish", snap['htf_5m'] == 'bearish' and snap['htf_15m'] == 'bearish'),
+        ("momentum", not momentum_filter(
+            snap['momentum'], params['adx_threshold'], params['rsi_min'], params['rsi_max']
+        )),
+        ("high_vol", AVOID_HIGH_VOLATILITY and snap['vol_regime'] == 'high'),
+        ("squeeze", AVOID_SQUEEZE and snap['squeeze']),
+    ]
+    blocks = [name for name, blocked in checks if blocked]
+    if blocks:
+        return None, blocks
+    
+    if pos_count == 0:
+        return 'open', blocks
+    
+    grid_step = calculate_grid_spacing(snap['atr_current'], level, params['atr_grid_multiplier'])
+    if last_price > 0 and snap['price'] <= last_price - grid_step:
+        # Extra confirmation for deeper levels
+        if level >= STACK_CONFIRM_LEVEL and not snap['bullish_candle']:
+            return 'confirm', blocks
+        return 'stack', blocks
+    
+    return None, blocks
+
+# =========================================================
+# SHADOW VARIANTS
+# =========================================================
+class ShadowVariant:
+    """
+    Paper-traded copy of the strategy with overridden params
+    Fed the live snapshot each loop; keeps a simulated basket and journal
+    (TP is checked at the main-loop rate, not the basket watcher rate)
+    """
+    def __init__(self, name, overrides):
+        self.name = name
+        self.params = strategy_params(overrides)
+        self.positions = []  # (price, lot)
+        self.lot_index = 0
+        self.last_entry_time = 0
+        self.last_buy_candle_time = 0
+        self.daily_trades = 0
+        self.trade_date = None
+        self.realized_pnl = 0.0
+        self.journal = {key: [] for key in trade_log}
+        self.journal_lock = Lock()
+
+    def floating_pnl(self, bid):
+        return sum((bid - price) * lot * CONTRACT_SIZE for price, lot in self.positions)
+
+    def equity(self, bid):
+        return INITIAL_EQUITY + self.realized_pnl + self.floating_pnl(bid)
+
+    def record(self, kind, level, lot, price, pnl, equity):
+        log_trade(kind, level, lot, price, pnl, equity, self.journal, self.journal_lock)
+
+    def on_snapshot(self, snap):
+        tick = snap['tick']
+        if tick is None:
+            return
+        
+        today = datetime.now().date()
+        if self.trade_date != today:
+            self.daily_trades = 0
+            self.trade_date = today
+        
+        # Exit: basket TP on the simulated positions
+        if self.positions:
+            pnl = self.floating_pnl(tick.bid)
+            volume = sum(lot for _, lot in self.positions)
+            avg_price = sum(price * lot for price, lot in self.positions) / volume
+            tp_target = calculate_dynamic_tp(
+                len(self.positions), avg_price, snap['price'],
+                snap['atr_current'], snap['atr_avg']
+            )
+            if tp_target and pnl >= tp_target:
+                self.realized_pnl += pnl
+                self.record('exit', len(self.positions), volume, avg_price, pnl, self.equity(tick.bid))
+                log.info(f"[SHADOW {self.name}] BASKET TP HIT | PnL=${pnl:.2f}")
+                self.positions = []
+                self.lot_index = 0
+                self.last_entry_time = 0
+                self.last_buy_candle_time = 0
+        
+        # Entry: same decision as the live strategy
+        last_price = self.positions[-1][0] if self.positions else 0.0
+        action, _ = entry_decision(
+            snap, self.params, len(self.positions), self.lot_index,
+            self.last_entry_time, self.daily_trades, last_price
+        )
+        if action not in ('open', 'stack'):
+            return
+        if CANDLE_BLOCK and snap['candle_time'] == self.last_buy_candle_time:
+            return
+        
+        lot = calculate_dynamic_lot(
+            self.lot_index, snap['atr_current'], snap['atr_avg'],
+            equity=self.equity(tick.bid),
+            martingale=self.params['martingale_multiplier']
+        )
+        self.positions.append((tick.ask, lot))
+        self.last_entry_time = time.time()
+        self.last_buy_candle_time = snap['candle_time']
+        self.daily_trades += 1
+        self.record('entry', self.lot_index, lot, tick.ask, 0, self.equity(tick.bid))
+        log.info(f"[SHADOW {self.name}] BUY | lot={lot} level={self.lot_index} price={tick.ask:.2f}")
+        self.lot_index += 1
+
+
+shadow_variants = [
+    ShadowVariant(v['name'], {k: val for k, val in v.items() if k != 'name'})
+    for v in SHADOW_VARIANTS
+]
+
 # =========================================================
 # MAIN LOOP
 # =========================================================
 def run():
-    global lot_index
+    global lot_index, daily_trades, last_entry_time, last_buy_candle_time
     log.info("BTC IMPROVED GRID BOT STARTED")
     
+    # Adopt a basket left open by a previous run
+    pos = get_buy_positions()
+    known_tickets.update(p.ticket for p in pos)
+    lot_index = len(pos)
+    if pos:
+        log.info(f"EXISTING BASKET ADOPTED | positions={len(pos)}")
+    
     while True:
         try:
+            # Wait for the supervisor to restore the connection
+            # (pending limits can't be cancelled while disconnected; the
+            # first loop after reconnect re-syncs them against the blocks)
+            if not mt5_connected.is_set():
+                publish_pause("disconnected")
+                time.sleep(1)
+                continue
+            
             # Safety checks
             if check_equity_stop():
                 log.critical("EQUITY STOP - Pausing for 5 minutes")
+                publish_pause("equity_stop", 300)
                 time.sleep(300)
                 continue
             
             if check_daily_loss():
                 log.critical("DAILY LOSS LIMIT - Pausing for 5 minutes")
+                if PENDING_GRID_MODE:
+                    cancel_pending_grid()
+                publish_pause("daily_loss", 300)
                 time.sleep(300)
                 continue
             
             # Load data
-            rates_1m = mt5.copy_rates_from_pos(SYMBOL, TIMEFRAME, 0, 120)
-            if rates_1m is None or len(rates_1m) < 100:
+            if not sync_bars():
                 time.sleep(1)
                 continue
             
-            df = pd.DataFrame(rates_1m)
+            df = get_bars(120)
+            if df is None or len(df) < 100:
+                time.sleep(1)
+                continue
             
-            # Calculate indicators
-            atr = ATR(df, 14)
-            atr_current = atr.iloc[-1]
-            atr_avg = atr.rolling(50).mean().iloc[-1]
+            # Shared market snapshot (live strategy + shadow variants)
+            snap = build_market_snapshot(df)
+            atr_current = snap['atr_current']
+            atr_avg = snap['atr_avg']
             
-            pos_count = len(get_buy_positions())
+            pos = get_buy_positions()
+            pos_count = len(pos)
             if pos_count == 0:
                 lot_index = 0
             
-            price = df['close'].iloc[-1]
-            allow_entry = True
-            blocks = []
+            check_daily_limit()
+            
+            # Pending grid fills show up as positions with unseen tickets
+            new_positions = sorted((p for p in pos if p.ticket not in known_tickets), key=lambda p: p.time)
+            known_tickets.update(p.ticket for p in new_positions)
+            if PENDING_GRID_MODE and new_positions:
+                account = mt5.account_info()
+                for p in new_positions:
+                    log_trade('entry', lot_index, p.volume, p.price_open, 0, account.equity)
+                    log.info(f"BUY LIMIT FILLED | lot={p.volume} level={lot_index} price={p.price_open:.2f}")
+                    fanout_signal(
+                        'buy', level=lot_index, lot=p.volume, atr_current=atr_current, atr_avg=atr_avg,
+                        price=p.price_open, bid=snap['tick'].bid
+                    )
+                    lot_index += 1
+                    daily_trades += 1
+                    last_entry_time = time.time()
+                    last_buy_candle_time = p.time - p.time % TIMEFRAME_SECONDS
             
-            # Check max levels
-            if lot_index >= MAX_LEVELS:
-                allow_entry = False
-                blocks.append("max_levels")
-            
-            # Check daily limit
-            if not check_daily_limit():
-                allow_entry = False
-                blocks.append("daily_limit")
-            
-            # Check global cooldown
-            if time.time() - last_entry_time < GLOBAL_COOLDOWN_SEC:
-                allow_entry = False
-                blocks.append("cooldown")
-            
-            # Check session
-            if not session_filter():
-                allow_entry = False
-                blocks.append("session")
-            
-            # Check HTF bias (5m and 15m)
-            htf_5m = get_htf_bias(SYMBOL, mt5.TIMEFRAME_M5)
-            htf_15m = get_htf_bias(SYMBOL, mt5.TIMEFRAME_M15)
-            
-            if htf_5m == 'bearish' and htf_15m == 'bearish':
-                allow_entry = False
-                blocks.append("htf_bearish")
-            
-            # Check momentum
-            if not momentum_filter(df):
-                allow_entry = False
-                blocks.append("momentum")
-            
-            # Check volatility
-            vol_regime = get_volatility_regime(df)
-            if AVOID_HIGH_VOLATILITY and vol_regime == 'high':
-                allow_entry = False
-                blocks.append("high_vol")
-            
-            if AVOID_SQUEEZE and bollinger_squeeze(df):
-                allow_entry = False
-                blocks.append("squeeze")
+            last_price = max(pos, key=lambda p: p.time).price_open if pos else 0.0
+            
+            action, blocks = entry_decision(
+                snap, strategy_params(), pos_count, lot_index,
+                last_entry_time, daily_trades, last_price
+            )
+            vol_pcts = " ".join(f"{lb}:{pct:.0f}" for lb, pct in vol_tracker.last_percentiles.items())
             
             log.info(
-                f"PRICE={price:.2f} | IDX={lot_index}/{MAX_LEVELS} | "
-                f"HTF=5m:{htf_5m}/15m:{htf_15m} | VOL={vol_regime} | "
-                f"ALLOW={allow_entry} | BLOCKS={blocks}"
+                f"PRICE={snap['price']:.2f} | IDX={lot_index}/{MAX_LEVELS} | "
+                f"HTF=5m:{snap['htf_5m']}/15m:{snap['htf_15m']} | "
+                f"VOL={snap['vol_regime']} ({vol_pcts}) | "
+                f"ALLOW={not blocks} | BLOCKS={blocks}"
             )
             
             # Entry logic
-            if pos_count == 0 and allow_entry:
-                lot = calculate_dynamic_lot(lot_index, atr_current, atr_avg)
-                buy(lot)
-                lot_index += 1
-            
-            elif pos_count > 0 and allow_entry and lot_index < MAX_LEVELS:
-                last_price = last_buy_price()
-                grid_step = calculate_grid_spacing(atr_current, lot_index)
-                
-                if last_price > 0 and price <= last_price - grid_step:
-                    # Extra confirmation for deeper levels
-                    if lot_index >= 3:
-                        bullish_candle = df['close'].iloc[-1] > df['open'].iloc[-1]
-                        if not bullish_candle:
-                            log.info("STACK BLOCKED | waiting bullish confirmation")
-                        else:
-                            lot = calculate_dynamic_lot(lot_index, atr_current, atr_avg)
-                            buy(lot)
-                            lot_index += 1
-                    else:
-                        lot = calculate_dynamic_lot(lot_index, atr_current, atr_avg)
-                        buy(lot)
+            if action == 'confirm':
+                log.info("STACK BLOCKED | waiting bullish confirmation")
+            elif action in ('open', 'stack'):
+                # Price ran through the ladder: drop the limits before the market buy
+                if PENDING_GRID_MODE and action == 'stack' and not clear_ladder_for_market_stack():
+                    log.info("STACK SKIPPED | pending limit filled or could not be removed")
+                else:
+                    lot = calculate_dynamic_lot(lot_index, atr_current, atr_avg)
+                    if buy(lot):
+                        fanout_signal(
+                            'buy', level=lot_index, lot=lot, atr_current=atr_current, atr_avg=atr_avg,
+                            price=snap['tick'].ask, bid=snap['tick'].bid
+                        )
                         lot_index += 1
             
+            # Positions changed if we just bought; sync on the next loop
+            if PENDING_GRID_MODE and action not in ('open', 'stack'):
+                sync_pending_grid(snap, pos, lot_index, blocks)
+            
+            # Paper-trade the shadow variants on the same snapshot
+            for variant in shadow_variants:
+                variant.on_snapshot(snap)
+            
+            if fanout_queues:
+                fanout_signal('mark', bid=snap['tick'].bid)
+                drain_fanout_results()
+            
+            publish_status(
+                strategy={
+                    "price": snap['price'],
+                    "lot_index": lot_index,
+                    "max_levels": MAX_LEVELS,
+                    "allow_entry": not blocks,
+                    "blocks": blocks,
+                    "action": action,
+                    "paused": None,
+                    "pending_grid_orders": pending_grid_count if PENDING_GRID_MODE else None,
+                },
+                indicators={
+                    "atr": atr_current,
+                    "atr_avg": atr_avg,
+                    "momentum": snap['momentum'],
+                    "htf_5m": snap['htf_5m'],
+                    "htf_15m": snap['htf_15m'],
+                    "vol_regime": snap['vol_regime'],
+                    "vol_percentiles": vol_tracker.last_percentiles,
+                    "squeeze": bool(snap['squeeze']),
+                    "session_ok": snap['session_ok'],
+                },
+                risk=risk_status(),
+                trades={"recent": recent_trades()},
+                shadows={
+                    v.name: {
+                        "positions": len(v.positions),
+                        "lot_index": v.lot_index,
+                        "realized_pnl": v.realized_pnl,
+                    }
+                    for v in shadow_variants
+                },
+            )
+            
             time.sleep(1)
             
         except Exception as e:
             log.error(f"MAIN LOOP ERROR: {e}")
             time.sleep(5)
 
+# =========================================================
+# MULTI-ACCOUNT FAN-OUT
+# =========================================================
+class TerminalAccount:
+    """Execution on a real account; lives in its own worker process"""
+    def __init__(self, config):
+        if not mt5.initialize(
+            path=config['path'],
+            login=config['login'],
+            password=config['password'],
+            server=config['server']
+        ):
+            raise RuntimeError(mt5.last_error())
+        if not mt5.symbol_select(SYMBOL, True):
+            raise RuntimeError("Symbol select failed")
+
+    def positions(self):
+        return [p for p in mt5.positions_get(symbol=SYMBOL) or [] if p.type == mt5.ORDER_TYPE_BUY]
+
+    def equity(self):
+        return mt5.account_info().equity
+
+    def position_count(self):
+        return len(self.positions())
+
+    def normalize(self, lot):
+        return normalize_lot(SYMBOL, lot)
+
+    def buy(self, lot, level, price):
+        tick = mt5.symbol_info_tick(SYMBOL)
+        result = send_market_buy(lot, tick.ask, f"Grid L{level}")
+        return result.retcode == mt5.TRADE_RETCODE_DONE
+
+    def close_all(self, bid):
+        pos = self.positions()
+        for p in pos:
+            close_position(p)
+        return len(pos)
+
+    def mark(self, bid):
+        pass
+
+
+class SimulatedAccount:
+    """In-memory account filled at the master's prices (local testing)"""
+    def __init__(self, config):
+        self.balance = config.get('equity', FANOUT_SIM_EQUITY)
+        self.contract_size = config.get('contract_size', CONTRACT_SIZE)
+        self.volume_step = config.get('volume_step', 0.01)
+        self.volume_min = config.get('volume_min', 0.01)
+        self.positions = []  # (price, lot)
+        self.bid = 0.0
+
+    def equity(self):
+        return self.balance + sum(
+            (self.bid - price) * lot * self.contract_size for price, lot in self.positions
+        )
+
+    def position_count(self):
+        return len(self.positions)
+
+    def normalize(self, lot):
+        return max(self.volume_min, round(lot / self.volume_step) * self.volume_step)
+
+    def buy(self, lot, level, price):
+        self.positions.append((price, lot))
+        return True
+
+    def close_all(self, bid):
+        self.mark(bid)
+        self.balance = self.equity()
+        count = len(self.positions)
+        self.positions = []
+        return count
+
+    def mark(self, bid):
+        if bid:
+            self.bid = bid
+
+
+def account_worker(config, signals, results, simulate, max_signal_age=FANOUT_SIGNAL_MAX_AGE_SEC):
+    """
+    Executes master signals on one account with its own risk limits
+    - entry level = this account's own position count; stack signals are
+      ignored while it has no basket (it skipped the opening entry)
+    - entry lot = uncapped lot for that level scaled by equity ratio, then
+      capped at this account's MAX_RISK_PCT
+    - max_levels, max_daily_loss_pct, equity_stop_pct per account
+    - limits are checked on every signal and every FANOUT_RISK_CHECK_SEC;
+      an account past its equity stop is flattened
+    - max_signal_age=None skips the entry staleness check (replays)
+    """
+    name = config['name']
+    account = SimulatedAccount(config) if simulate else TerminalAccount(config)
+    start_equity = account.equity()
+    day, day_equity = datetime.now().date(), start_equity
+    
+    while True:
+        try:
+            signal = signals.get(timeout=FANOUT_RISK_CHECK_SEC)
+        except queue.Empty:
+            signal = {"action": "check"}
+        if signal is None:
+            break
+        
+        try:
+            bid = signal.get('bid')
+            account.mark(bid)
+            equity = account.equity()
+            if datetime.now().date() != day:
+                day, day_equity = datetime.now().date(), equity
+            
+            result = {"account": name, "action": signal['action'], "time": time.time()}
+            blocks = []
+            if (day_equity - equity) / day_equity * 100 >= config.get('max_daily_loss_pct', MAX_DAILY_LOSS_PCT):
+                blocks.append("daily_loss")
+            if (start_equity - equity) / start_equity * 100 >= config.get('equity_stop_pct', EQUITY_STOP_PCT):
+                blocks.append("equity_stop")
+                if account.position_count():
+                    result['closed'] = account.close_all(bid)
+            
+            if signal['action'] == 'close_all':
+                result['closed'] = result.get('closed', 0) + account.close_all(bid)
+            
+            elif signal['action'] == 'buy':
+                # Size from this account's own basket; it may have skipped entries
+                level = account.position_count()
+                if max_signal_age is not None and time.time() - signal['time'] > max_signal_age:
+                    blocks.append("stale_signal")
+                if signal['level'] > 0 and level == 0:
+                    blocks.append("no_basket")
+                if level >= config.get('max_levels', MAX_LEVELS):
+                    blocks.append("max_levels")
+                
+                if not blocks:
+                    scale = equity / signal['master_equity']
+                    lot = min(
+                        base_lot_size(level, signal['atr_current'], signal['atr_avg']) * scale,
+                        max_risk_lot(equity, signal['atr_current'])
+                    )
+                    lot = account.normalize(lot)
+                    result['lot'] = lot
+                    result['level'] = level
+                    result['ok'] = account.buy(lot, level, signal['price'])
+            
+            elif 'closed' not in result:
+                continue  # Mark/check with nothing to report
+            
+            if blocks:
+                result['blocks'] = blocks
+            result['equity'] = account.equity()
+            result['positions'] = account.position_count()
+        except Exception as e:
+            result = {"account": name, "action": signal['action'], "error": str(e)}
+        
+        results.put(result)
+
+def start_fanout():
+    """One worker process (and terminal) per account in FANOUT_ACCOUNTS"""
+    global fanout_results
+    
+    fanout_results = multiprocessing.Queue()
+    for config in FANOUT_ACCOUNTS:
+        if FANOUT_SIMULATE:
+            config = {"contract_size": CONTRACT_SIZE, **config}
+        signals = multiprocessing.Queue()
+        multiprocessing.Process(
+            target=account_worker,
+            args=(config, signals, fanout_results, FANOUT_SIMULATE),
+            daemon=True
+        ).start()
+        fanout_queues.append(signals)
+    
+    log.info(f"FAN-OUT STARTED | accounts={len(fanout_queues)} | simulate={FANOUT_SIMULATE}")
+
+def fanout_signal(action, **fields):
+    if not fanout_queues:
+        return
+    
+    signal = {"action": action, "time": time.time(), "master_equity": last_equity or INITIAL_EQUITY, **fields}
+    for signals in fanout_queues:
+        signals.put(signal)
+
+def drain_fanout_results():
+    while True:
+        try:
+            result = fanout_results.get_nowait()
+        except queue.Empty:
+            break
+        
+        fanout_state[result['account']] = result
+        if 'error' in result:
+            log.error(f"FAN-OUT ERROR | {result['account']} | {result['error']}")
+        elif result.get('blocks'):
+            log.info(f"FAN-OUT BLOCKED | {result['account']} | {result['blocks']}")
+    
+    publish_status(accounts=fanout_state)
+
+def replay_fanout(signals, accounts):
+    """
+    Run signals through account_worker in-process on simulated accounts
+    Returns the per-account results (no terminal or processes needed)
+    Recorded signals are replayed as-is, so their age is not checked
+    """
+    results = queue.Queue()
+    for config in accounts:
+        inbox = queue.Queue()
+        for signal in signals:
+            inbox.put(signal)
+        inbox.put(None)
+        account_worker(config, inbox, results, simulate=True, max_signal_age=None)
+    return [results.get() for _ in range(results.qsize())]
+
+# =========================================================
+# STATUS API
+# =========================================================
+def publish_status(**sections):
+    """
+    Called by the trading threads with data they already computed
+    Each section is serialized once here, so requests only copy bytes
+    """
+    global status_bodies
+    
+    with status_lock:
+        for name, data in sections.items():
+            status_sections[name] = json.dumps(
+                json_safe({"updated": time.time(), **data}), default=str, allow_nan=False
+            ).encode()
+        
+        bodies = {f"/status/{name}": body for name, body in status_sections.items()}
+        bodies["/status"] = (
+            b"{" + b",".join(
+                json.dumps(name).encode() + b":" + body
+                for name, body in status_sections.items()
+            ) + b"}"
+        )
+        status_bodies = bodies
+
+def json_safe(value):
+    """NaN/inf -> None (null) and numpy scalars -> Python, recursively"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {k: json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    return value
+
+def recent_trades():
+    n = STATUS_RECENT_TRADES
+    with trade_log_lock:
+        columns = {key: values[-n:] for key, values in trade_log.items()}
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+def risk_status(paused=None, paused_until=None):
+    drawdown_pct = (INITIAL_EQUITY - last_equity) / INITIAL_EQUITY * 100 if INITIAL_EQUITY else 0.0
+    return {
+        "connected": mt5_connected.is_set(),
+        "paused": paused,
+        "paused_until": paused_until,
+        "initial_equity": INITIAL_EQUITY,
+        "equity": last_equity,
+        "drawdown_pct": drawdown_pct,
+        "equity_stop_pct": EQUITY_STOP_PCT,
+        "equity_stop_hit": drawdown_pct >= EQUITY_STOP_PCT,
+        "max_daily_loss_pct": MAX_DAILY_LOSS_PCT,
+        "daily_loss_hit": drawdown_pct >= MAX_DAILY_LOSS_PCT,
+        "daily_trades": daily_trades,
+        "max_trades_per_day": MAX_TRADES_PER_DAY,
+        "cooldown_left": max(0, GLOBAL_COOLDOWN_SEC - (time.time() - last_entry_time)),
+    }
+
+def publish_pause(reason, seconds=None):
+    """Publish before the main loop pauses, so /status doesn't show stale entries"""
+    publish_status(
+        strategy={
+            "lot_index": lot_index,
+            "max_levels": MAX_LEVELS,
+            "allow_entry": False,
+            "blocks": [reason],
+            "action": None,
+            "paused": reason,
+        },
+        risk=risk_status(reason, time.time() + seconds if seconds else None),
+    )
+
+class StatusHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = status_bodies.get(self.path.split("?")[0].rstrip("/") or "/status")
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep request lines out of the bot log
+
+def status_server():
+    server = ThreadingHTTPServer((STATUS_API_HOST, STATUS_API_PORT), StatusHandler)
+    server.daemon_threads = True
+    log.info(f"STATUS API STARTED | http://{STATUS_API_HOST}:{STATUS_API_PORT}/status")
+    server.serve_forever()
+
 # =========================================================
 # SAVE TRADE LOG
 # =========================================================
@@ -760,11 +1902,18 @@ def save_trade_log():
     while True:
         try:
             time.sleep(3600)  # Save every hour
-            if trade_log['timestamp']:
-                df = pd.DataFrame(trade_log)
+            with trade_log_lock:
+                df = pd.DataFrame(trade_log) if trade_log['timestamp'] else None
+            if df is not None:
                 filename = f"trades_{datetime.now().date()}.csv"
                 df.to_csv(filename, index=False)
                 log.info(f"Trade log saved to {filename}")
+            for variant in shadow_variants:
+                with variant.journal_lock:
+                    df = pd.DataFrame(variant.journal) if variant.journal['timestamp'] else None
+                if df is not None:
+                    filename = f"shadow_{variant.name}_{datetime.now().date()}.csv"
+                    df.to_csv(filename, index=False)
         except Exception as e:
             log.error(f"Error saving trade log: {e}")
 
@@ -773,8 +1922,13 @@ def save_trade_log():
 # =========================================================
 if __name__ == "__main__":
     init_mt5()
+    if FANOUT_ACCOUNTS:
+        start_fanout()
+    Thread(target=connection_supervisor, daemon=True).start()
     Thread(target=basket_watcher, daemon=True).start()
     Thread(target=save_trade_log, daemon=True).start()
+    if STATUS_API_ENABLED:
+        Thread(target=status_server, daemon=True).start()
     run()
 
 # Made with Bob
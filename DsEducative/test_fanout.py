@@ -0,0 +1,96 @@
+"""
+Fan-out path on simulated accounts (no terminal needed)
+MetaTrader5 is Windows-only, so it is stubbed before algo is imported
+"""
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import pytest
+
+sys.modules.setdefault("MetaTrader5", mock.MagicMock())
+
+# algo logs to a file in the working directory on import
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+try:
+    import algo
+finally:
+    os.chdir(_cwd)
+
+
+RECORDED = time.time() - 3600  # Replays must accept old signals
+FINE = {"volume_step": 0.001, "volume_min": 0.001}
+
+
+def buy_signal(level, price, atr=50.0):
+    return {
+        "action": "buy", "time": RECORDED, "master_equity": 10000.0, "level": level,
+        "lot": algo.BASE_LOT, "atr_current": atr, "atr_avg": atr, "price": price, "bid": price
+    }
+
+
+def test_lot_scales_with_equity_ratio():
+    small, big = algo.replay_fanout(
+        [buy_signal(0, 70000)],
+        [{"name": "small", "equity": 5000, **FINE}, {"name": "big", "equity": 40000, **FINE}]
+    )
+    assert small['lot'] == pytest.approx(algo.BASE_LOT * 0.5)
+    assert big['lot'] == pytest.approx(algo.BASE_LOT * 4)
+
+
+def test_lot_never_exceeds_account_risk_cap():
+    capped, = algo.replay_fanout(
+        [buy_signal(0, 70000, atr=5000.0)],
+        [{"name": "capped", "equity": 20000, **FINE}]
+    )
+    assert capped['lot'] == pytest.approx(algo.max_risk_lot(20000, 5000.0))
+
+
+def test_recorded_signals_are_not_stale_in_replay():
+    result, = algo.replay_fanout([buy_signal(0, 70000)], [{"name": "replay", "equity": 10000}])
+    assert result['ok']
+    assert 'blocks' not in result
+
+
+def test_max_levels_per_account():
+    first, second = algo.replay_fanout(
+        [buy_signal(0, 70000), buy_signal(1, 69900)],
+        [{"name": "shallow", "equity": 10000, "max_levels": 1}]
+    )
+    assert first['ok']
+    assert second['blocks'] == ["max_levels"]
+
+
+def test_stack_ignored_without_basket():
+    stack, = algo.replay_fanout([buy_signal(3, 69000)], [{"name": "late", "equity": 10000}])
+    assert stack['blocks'] == ["no_basket"]
+    assert 'lot' not in stack
+
+
+def test_level_follows_account_basket_not_master():
+    account = {"name": "behind", "equity": 10000, **FINE}
+    opening, stack = algo.replay_fanout(
+        [buy_signal(0, 70000), buy_signal(4, 69000)],
+        [account]
+    )
+    assert stack['level'] == 1
+    assert stack['lot'] == pytest.approx(algo.base_lot_size(1, 50.0, 50.0))
+
+
+def test_daily_loss_blocks_and_equity_stop_flattens():
+    account = {"name": "losing", "equity": 10000, "contract_size": 100}
+    entry, daily, stop, after = algo.replay_fanout([
+        buy_signal(0, 70000),
+        buy_signal(1, 69650),                                # -350 = 3.5%
+        {"action": "mark", "time": RECORDED, "bid": 69400},  # -600 = 6%
+        buy_signal(1, 69400),
+    ], [account])
+    assert entry['ok']
+    assert daily['blocks'] == ["daily_loss"]
+    assert stop['closed'] == 1
+    assert stop['positions'] == 0
+    assert "equity_stop" in after['blocks']
+    assert 'lot' not in after